@@ -1,12 +1,19 @@
 import numpy as np
 from gcn_kafka import Consumer
 from gcn_listener.gcn_utils import get_dateobs, get_properties, get_notice_type, \
-    get_root_from_payload, inv_notice_types_dict, get_tags
+    get_root_from_payload, inv_notice_types_dict, get_tags, get_position, get_ivorn
+from gcn_listener.json_utils import get_alert_from_payload, igwn_topics
 from astropy.time import Time
 import os
 import gcn
 from gcn_listener.actions import send_voevent_email, send_gmail, send_message, \
-    make_phone_call, send_voevent_message, make_voevent_phone_call
+    make_phone_call, send_voevent_message, make_voevent_phone_call, \
+    get_voevent_call_text
+from gcn_listener.routing import ChannelRouter
+from gcn_listener.profiling import MessageProfiler, default_profile_dir
+from gcn_listener.crossmatch import ActiveEventIndex
+from gcn_listener.escalation import EscalationManager, EscalationStore, \
+    default_store_path
 import argparse
 import logging
 from pathlib import Path
@@ -66,78 +73,166 @@ def needs_action(voevent,
     return action_needed
 
 
+def notify(voevent,
+           action: list,
+           router: ChannelRouter,
+           annotations: list = None,
+           email_recipients: str = None,
+           phone_recipients: str = None,
+           secondary_phone_recipients: str = None,
+           escalation: EscalationManager = None):
+    if ('email' in action) & (email_recipients is None):
+        err = "No email recipients provided"
+        raise ValueError(err)
+    if ('sms' in action) & (phone_recipients is None):
+        err = "No phone recipients provided"
+        raise ValueError(err)
+
+    # Channels are only used if all their credentials are set, since the
+    # actions prompt for missing ones and a fallback must never block on that
+    email_configured = np.all([os.getenv(var, None) is not None
+                               for var in ['WATCHDOG_EMAIL',
+                                           'WATCHDOG_EMAIL_PASSWORD']])
+    twilio_configured = np.all([os.getenv(var, None) is not None
+                                for var in ['TWILIO_ACCOUNT_SID',
+                                            'TWILIO_AUTH_TOKEN',
+                                            'TWILIO_PHONE']])
+    if ('email' in action) & (not email_configured):
+        err = "WATCHDOG_EMAIL or WATCHDOG_EMAIL_PASSWORD not set"
+        raise ValueError(err)
+    if (('sms' in action) | ('call' in action)) & (not twilio_configured):
+        err = "TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN or TWILIO_PHONE not set"
+        raise ValueError(err)
+
+    senders = {}
+    if (email_recipients is not None) & email_configured:
+        senders['email'] = lambda: send_voevent_email(
+            voevent, email_recipients=email_recipients, annotations=annotations)
+    if (phone_recipients is not None) & twilio_configured:
+        senders['sms'] = lambda: send_voevent_message(
+            voevent, message_recipients=phone_recipients, annotations=annotations)
+        senders['call'] = lambda: make_voevent_phone_call(
+            voevent, phone_recipients=phone_recipients)
+    if (secondary_phone_recipients is not None) & twilio_configured:
+        senders['call_secondary'] = lambda: make_voevent_phone_call(
+            voevent, phone_recipients=secondary_phone_recipients)
+    if escalation is not None:
+        # Calls go down the on-call list until someone acknowledges
+        senders['call'] = lambda: escalation.alert(
+            get_voevent_call_text(voevent))
+        senders.pop('call_secondary', None)
+
+    delivered = router.notify(action, senders)
+    logger.info(f"Alert delivered via {delivered}")
+
+
 def listen(hasNS_thresh: float = None,
            far_thresh_per_year: float = None,
            action: list = ['email'],
            allowed_notice_types: list = default_allowed_notice_type_list,
            reject_tags: list = ['MDC'],
            email_recipients: str = os.getenv('RECIPIENT_EMAIL', None),
-           phone_recipients: str = os.getenv('RECIPIENT_PHONE', None)
+           phone_recipients: str = os.getenv('RECIPIENT_PHONE', None),
+           secondary_phone_recipients: str = os.getenv('SECONDARY_RECIPIENT_PHONE',
+                                                       None),
+           router: ChannelRouter = None,
+           profiler: MessageProfiler = None,
+           event_index: ActiveEventIndex = None,
+           stream: str = 'voevent',
+           escalation: EscalationManager = None
            ):
+    if router is None:
+        router = ChannelRouter()
+    router.start_probes()
+    if profiler is None:
+        profiler = MessageProfiler(enabled=False)
+    profiler.start()
+    if event_index is None:
+        event_index = ActiveEventIndex()
+    if escalation is not None:
+        escalation.start()
+
     # Connect as a consumer.
     # Warning: don't share the client secret with others.
     consumer = Consumer(client_id=KAFKA_CLIENT_ID,
                         client_secret=KAFKA_CLIENT_SECRET)
     # Subscribe to topics and receive alerts
-    consumer.subscribe(['gcn.classic.voevent.LVC_COUNTERPART',
-                        'gcn.classic.voevent.LVC_EARLY_WARNING',
-                        'gcn.classic.voevent.LVC_INITIAL',
-                        'gcn.classic.voevent.LVC_PRELIMINARY',
-                        'gcn.classic.voevent.LVC_RETRACTION',
-                        'gcn.classic.voevent.LVC_TEST',
-                        'gcn.classic.voevent.LVC_UPDATE'])
+    if stream == 'json':
+        # JSON alerts are cheaper to parse and carry the skymap inline
+        topics = igwn_topics
+    else:
+        topics = ['gcn.classic.voevent.LVC_COUNTERPART',
+                  'gcn.classic.voevent.LVC_EARLY_WARNING',
+                  'gcn.classic.voevent.LVC_INITIAL',
+                  'gcn.classic.voevent.LVC_PRELIMINARY',
+                  'gcn.classic.voevent.LVC_RETRACTION',
+                  'gcn.classic.voevent.LVC_TEST',
+                  'gcn.classic.voevent.LVC_UPDATE']
+    consumer.subscribe(topics)
     while True:
+        profiler.poll()
         for message in consumer.consume(timeout=1):
             value = message.value()
             if 'Subscribed topic' in str(value):
                 continue
-            if len(value) > 0:
-                voevent = get_root_from_payload(value)
-                dateobs = get_dateobs(voevent)
+            if len(value) == 0:
+                continue
+            with profiler.message() as record:
+                with record.stage('parse'):
+                    if message.topic() in igwn_topics:
+                        voevent = get_alert_from_payload(value)
+                    else:
+                        voevent = get_root_from_payload(value)
+                    dateobs = get_dateobs(voevent)
+                record.ivorn = get_ivorn(voevent)
 
                 logger.info(f"Received VOevent for {dateobs}")
-                savedir = Path(f"~/Data/gcn_listener/voevents/")
-                if not savedir.exists():
-                    savedir.mkdir(parents=True)
+                with record.stage('save'):
+                    savedir = Path(f"~/Data/gcn_listener/voevents/")
+                    if not savedir.exists():
+                        savedir.mkdir(parents=True)
 
-                with open(f"~/Data/gcn_listener/voevents/{Time(dateobs).isot}",
-                          'w') as f:
-                    f.write(str(value))
+                    with open(f"~/Data/gcn_listener/voevents/{Time(dateobs).isot}",
+                              'w') as f:
+                        f.write(str(value))
                 logger.info(f"Written VOevent to file - "
                             f"~/Data/gcn_listener/voevents/{Time(dateobs).isot}")
 
-                action_needed = needs_action(voevent, hasNS_thresh=hasNS_thresh,
-                                             far_thresh_per_year=far_thresh_per_year,
-                                             allowed_notice_types=allowed_notice_types,
-                                             reject_tags=reject_tags)
+                # Check if the position (e.g. of a counterpart or GRB) is in
+                # the credible region of an active GW event
+                annotations = []
+                position = get_position(voevent)
+                if position is not None:
+                    with record.stage('crossmatch'):
+                        ra, dec, _ = position
+                        annotations = event_index.annotate(ra, dec)
+                    if len(annotations) > 0:
+                        logger.info(f"Crossmatch: {annotations}")
+
+                with record.stage('needs_action'):
+                    action_needed = needs_action(
+                        voevent, hasNS_thresh=hasNS_thresh,
+                        far_thresh_per_year=far_thresh_per_year,
+                        allowed_notice_types=allowed_notice_types,
+                        reject_tags=reject_tags)
 
                 if action_needed:
-                    if 'email' in action:
-                        if email_recipients is None:
-                            err = "No email recipients provided"
-                            raise ValueError(err)
-                        try:
-                            send_voevent_email(voevent,
-                                               email_recipients=email_recipients)
-                        except Exception as e:
-                            logger.error(f"Failed to send email with error {e}")
-
-                    if 'sms' in action:
-                        if phone_recipients is None:
-                            err = "No phone recipients provided"
-                            raise ValueError(err)
-                        try:
-                            send_voevent_message(voevent,
-                                                 message_recipients=phone_recipients)
-                        except Exception as e:
-                            logger.error(f"Failed to send message with error {e}")
-
-                    if 'call' in action:
-                        try:
-                            make_voevent_phone_call(voevent,
-                                                    phone_recipients=phone_recipients)
-                        except Exception as e:
-                            logger.error(f"Failed to make phone call with error {e}")
+                    with record.stage('notify'):
+                        notify(voevent, action=action, router=router,
+                               annotations=annotations,
+                               email_recipients=email_recipients,
+                               phone_recipients=phone_recipients,
+                               secondary_phone_recipients=secondary_phone_recipients,
+                               escalation=escalation)
+
+                # Add GW events to the index after notifying, since it may
+                # need to download the skymap
+                with record.stage('index'):
+                    try:
+                        event_index.update(voevent, reject_tags=reject_tags)
+                    except Exception as e:
+                        logger.error(f"Failed to update active events "
+                                     f"with error {e}")
 
 
 if __name__ == '__main__':
@@ -156,6 +251,36 @@ if __name__ == '__main__':
     # Removing RETRACTIONS because MOCK retractions don't come with MDC tag (very dumb)
     parser.add_argument('-include_mocks', action='store_true',
                         help='Include mock events (helpful for testing)')
+    parser.add_argument('-stream', choices=['voevent', 'json'], default='voevent',
+                        help='Listen to the classic VOEvent topics or the IGWN '
+                             'JSON alert topic')
+    parser.add_argument('-escalate', action='store_true',
+                        help='Escalate unacknowledged calls through the on-call '
+                             'list (needs a callback URL reachable by Twilio)')
+    parser.add_argument('-on_call', nargs="+", default=None,
+                        help='Phone numbers to call in order when escalating '
+                             '(default: RECIPIENT_PHONE, SECONDARY_RECIPIENT_PHONE)')
+    parser.add_argument('-ack_timeout', default=300., type=float,
+                        help='Seconds to wait for acknowledgement before '
+                             'calling the next number')
+    parser.add_argument('-max_alert_age', default=3600., type=float,
+                        help='Seconds after which an unacknowledged alert is no '
+                             'longer escalated (e.g. after a restart)')
+    parser.add_argument('-callback_url',
+                        default=os.getenv('ESCALATION_CALLBACK_URL', None),
+                        help='Public URL of the escalation callback server')
+    parser.add_argument('-callback_port', default=8080, type=int,
+                        help='Port to run the escalation callback server on')
+    parser.add_argument('-escalation_db', default=default_store_path,
+                        help='File to keep escalation state in')
+    parser.add_argument('-profile', '--profile', action='store_true',
+                        help='Profile message processing (CPU and allocations)')
+    parser.add_argument('-profile_dir', default=default_profile_dir,
+                        help='Directory to write profiles to')
+    parser.add_argument('-profile_sample', default=1, type=int,
+                        help='Run every Nth message under cProfile')
+    parser.add_argument('-profile_interval', default=3600., type=float,
+                        help='Seconds between profile dumps')
 
     args = parser.parse_args()
 
@@ -206,9 +331,35 @@ if __name__ == '__main__':
             make_phone_call(call_recipients=os.getenv('RECIPIENT_PHONE'),
                             message_text="Started listening for GCN events")
 
+    escalation = None
+    if args.escalate:
+        if 'call' not in args.action:
+            raise ValueError("Escalation needs the call action")
+        if args.callback_url is None:
+            raise ValueError("No escalation callback URL provided")
+        on_call = args.on_call
+        if on_call is None:
+            on_call = os.getenv('RECIPIENT_PHONE').split(",")
+            if os.getenv('SECONDARY_RECIPIENT_PHONE', None) is not None:
+                on_call += os.getenv('SECONDARY_RECIPIENT_PHONE').split(",")
+        escalation = EscalationManager(on_call=on_call,
+                                       public_url=args.callback_url,
+                                       ack_timeout=args.ack_timeout,
+                                       max_alert_age=args.max_alert_age,
+                                       store=EscalationStore(args.escalation_db),
+                                       port=args.callback_port)
+
+    profiler = MessageProfiler(enabled=args.profile,
+                               outdir=args.profile_dir,
+                               sample_every=args.profile_sample,
+                               dump_interval=args.profile_interval)
+
     listen(hasNS_thresh=args.hasNS_thresh,
            far_thresh_per_year=args.FAR_thresh,
            action=args.action,
            allowed_notice_types=allowed_notice_types,
-           reject_tags=reject_tags
+           reject_tags=reject_tags,
+           profiler=profiler,
+           stream=args.stream,
+           escalation=escalation
            )
@@ -14,14 +14,19 @@ from gcn_listener.gcn_utils import get_dateobs, get_notice_type, get_properties,
 from astropy.time import Time
 import numpy as np
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 
 
 logger = logging.getLogger(__name__)
 GMAIL_PORT = 465  # For SSL
+# Socket timeouts (s), so a degraded transport fails fast instead of hanging
+SMTP_TIMEOUT = 10
+TWILIO_TIMEOUT = 10
 
 
 def send_voevent_email(voevent,
                        email_recipients: str | list[str],
+                       annotations: Optional[list[str]] = None,
                        ):
     dateobs = get_dateobs(voevent)
     date_isot = Time(dateobs).isot
@@ -32,6 +37,8 @@ def send_voevent_email(voevent,
     email_text = f"GCN {notice_type} {date_isot}"
     email_text += f"\nProperties: {properties}"
     email_text += f"\nTags: {list(tags)}"
+    if annotations:
+        email_text += f"\nCrossmatch: {'; '.join(annotations)}"
     logger.info(f"Sending email to {email_recipients}"
                 f" with subject {email_subject}"
                 f" and text {email_text}")
@@ -39,7 +46,8 @@ def send_voevent_email(voevent,
 
 
 def send_voevent_message(voevent,
-                         message_recipients: str | list[str]):
+                         message_recipients: str | list[str],
+                         annotations: Optional[list[str]] = None):
     dateobs = get_dateobs(voevent)
     date_isot = Time(dateobs).isot
     properties = get_properties(voevent)
@@ -48,18 +56,25 @@ def send_voevent_message(voevent,
     message_text = f"GCN {notice_type} {date_isot}"
     message_text += f"\nProperties: {properties}"
     message_text += f"\nTags: {list(tags)}"
+    if annotations:
+        message_text += f"\nCrossmatch: {'; '.join(annotations)}"
     logger.info(f"Sending message to {message_recipients}"
                 f" with text {message_text}")
     send_message(message_recipients, message_text)
 
 
-def make_voevent_phone_call(voevent,
-                            phone_recipients: str | list[str]):
+def get_voevent_call_text(voevent) -> str:
     dateobs = get_dateobs(voevent)
     date_isot = Time(dateobs).isot
     notice_type = notice_types_dict[get_notice_type(voevent)]
     phone_text = f"New GCN alert with notice type {notice_type} {date_isot}. "
     phone_text += "Check your message for more information"
+    return phone_text
+
+
+def make_voevent_phone_call(voevent,
+                            phone_recipients: str | list[str]):
+    phone_text = get_voevent_call_text(voevent)
     logger.info(f"Making phone call to {phone_recipients}"
                 f" with text {phone_text}")
     make_phone_call(phone_recipients, phone_text)
@@ -73,6 +88,7 @@ def send_gmail(
     email_password: str = os.getenv("WATCHDOG_EMAIL_PASSWORD"),
     attachments: Optional[str | list[str]] = None,
     auto_compress: bool = True,
+    timeout: float = SMTP_TIMEOUT,
 ):
     """
     Function to send an email to a list of recipients from a gmail account.
@@ -84,6 +100,7 @@ def send_gmail(
     :param email_password: Password for sender gmail account
     :param attachments: Any files to attach
     :param auto_compress: Boolean to compress large attachments before sending
+    :param timeout: Socket timeout in seconds for the SMTP connection
     :return:
     """
     # pylint: disable=too-many-arguments
@@ -138,17 +155,36 @@ def send_gmail(
     # Create a secure SSL context
     context = ssl.create_default_context()
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", GMAIL_PORT, context=context) as server:
+    with smtplib.SMTP_SSL("smtp.gmail.com", GMAIL_PORT, context=context,
+                          timeout=timeout) as server:
         server.login(email_sender, email_password)
         server.send_message(msg)
 
 
+def get_twilio_client(
+    twilio_account_sid: str,
+    twilio_auth_token: str,
+    timeout: float = TWILIO_TIMEOUT,
+) -> Client:
+    """
+    Function to make a twilio Client whose requests time out
+
+    :param twilio_account_sid: Twilio account SID
+    :param twilio_auth_token: Twilio auth token
+    :param timeout: Timeout in seconds for requests to the Twilio API
+    :return: twilio Client
+    """
+    return Client(twilio_account_sid, twilio_auth_token,
+                  http_client=TwilioHttpClient(timeout=timeout))
+
+
 def send_message(
     message_recipients: str | list[str],
     message_text: str,
     twilio_account_sid: str = os.getenv("TWILIO_ACCOUNT_SID", None),
     twilio_auth_token: str = os.getenv("TWILIO_AUTH_TOKEN", None),
     twilio_phone_number: str = os.getenv("TWILIO_PHONE", None),
+    timeout: float = TWILIO_TIMEOUT,
 ):
     """
     Function to send a text message to a list of recipients from a twilio account.
@@ -158,6 +194,7 @@ def send_message(
     :param twilio_account_sid: Twilio account SID
     :param twilio_auth_token: Twilio auth token
     :param twilio_phone_number: Twilio phone number
+    :param timeout: Timeout in seconds for requests to the Twilio API
     :return:
     """
     # pylint: disable=too-many-arguments
@@ -174,7 +211,8 @@ def send_message(
     if twilio_phone_number is None:
         twilio_phone_number = getpass.getpass(prompt="Twilio phone number: ")
 
-    client = Client(twilio_account_sid, twilio_auth_token)
+    client = get_twilio_client(twilio_account_sid, twilio_auth_token,
+                               timeout=timeout)
 
     for recipient in message_recipients:
         logger.info(f"Sending message to {recipient}")
@@ -189,6 +227,7 @@ def make_phone_call(
         twilio_account_sid: str = os.getenv("TWILIO_ACCOUNT_SID", None),
         twilio_auth_token: str = os.getenv("TWILIO_AUTH_TOKEN", None),
         twilio_phone_number: str = os.getenv("TWILIO_PHONE", None),
+        timeout: float = TWILIO_TIMEOUT,
 ):
     if not isinstance(call_recipients, list):
         call_recipients = [call_recipients]
@@ -202,7 +241,8 @@ def make_phone_call(
     if twilio_phone_number is None:
         twilio_phone_number = getpass.getpass(prompt="Twilio phone number: ")
 
-    client = Client(twilio_account_sid, twilio_auth_token)
+    client = get_twilio_client(twilio_account_sid, twilio_auth_token,
+                               timeout=timeout)
 
     for recipient in call_recipients:
         logger.info(f"Calling {recipient}")
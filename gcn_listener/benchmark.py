@@ -0,0 +1,95 @@
+# Benchmark the per-message latency of the VOEvent and JSON ingestion paths
+#
+# python -m gcn_listener.benchmark
+# python -m gcn_listener.benchmark -voevent <file.xml> -json <file.json>
+
+import argparse
+import base64
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+import orjson
+from astropy.table import Table
+from gcn_listener.crossmatch import read_skymap
+from gcn_listener.gcn_utils import get_dateobs, get_notice_type, get_properties, \
+    get_root_from_payload, get_skymap, get_tags
+from gcn_listener.json_utils import get_alert_from_payload
+
+examples_dir = Path(__file__).parent / "data/examples"
+
+
+def make_skymap(n_pixels: int = 20000) -> str:
+    """
+    Function to make a base64 encoded multi-order skymap with roughly
+    n_pixels pixels, similar in size to a BAYESTAR skymap
+
+    :param n_pixels: number of pixels
+    :return: base64 encoded FITS file
+    """
+    order = int(np.ceil(np.log(n_pixels / 12) / np.log(4)))
+    ipix = np.sort(np.random.choice(12 * 4 ** order, n_pixels, replace=False))
+    table = Table({'UNIQ': 4 * 4 ** order + ipix,
+                   'PROBDENSITY': np.random.random(n_pixels)})
+    fits_file = io.BytesIO()
+    table.write(fits_file, format='fits')
+    return base64.b64encode(fits_file.getvalue()).decode('ascii')
+
+
+def process(root):
+    """The per-message work needs_action and the actions do."""
+    get_dateobs(root)
+    get_properties(root)
+    list(get_tags(root))
+    get_notice_type(root)
+
+
+def time_path(parse, payload, n_iter: int, read_skymaps: bool = False):
+    latencies = []
+    for _ in range(n_iter):
+        t0 = time.perf_counter()
+        root = parse(payload)
+        process(root)
+        if read_skymaps:
+            read_skymap(get_skymap(root))
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies) * 1e3
+
+
+def report(name, latencies):
+    print(f"{name:<24} median {np.median(latencies):8.3f} ms   "
+          f"p90 {np.percentile(latencies, 90):8.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-voevent', default=examples_dir /
+                        "MS181101ab-preliminary.xml",
+                        help='VOEvent file to parse')
+    parser.add_argument('-json', default=examples_dir /
+                        "MS181101ab-preliminary.json",
+                        help='IGWN JSON alert file to parse')
+    parser.add_argument('-n', default=100, type=int,
+                        help='Number of iterations')
+    parser.add_argument('-skymap_pixels', default=20000, type=int,
+                        help='Pixels in the skymap added to JSON alerts '
+                             'without one')
+    args = parser.parse_args()
+
+    with open(args.voevent, 'rb') as f:
+        voevent_payload = f.read()
+    with open(args.json, 'rb') as f:
+        json_payload = f.read()
+
+    alert = orjson.loads(json_payload)
+    if alert['event'] is not None and alert['event'].get('skymap') is None:
+        alert['event']['skymap'] = make_skymap(args.skymap_pixels)
+    json_payload = orjson.dumps(alert)
+
+    print(f"VOEvent payload {len(voevent_payload) / 1e3:.1f} kB, "
+          f"JSON payload {len(json_payload) / 1e3:.1f} kB, {args.n} iterations")
+    report("VOEvent", time_path(get_root_from_payload, voevent_payload, args.n))
+    report("JSON", time_path(get_alert_from_payload, json_payload, args.n))
+    report("JSON + skymap decode", time_path(get_alert_from_payload, json_payload,
+                                             args.n, read_skymaps=True))
@@ -0,0 +1,182 @@
+# Module to cross-match counterpart/GRB positions against the credible regions
+# of active GW events
+
+import io
+import logging
+from datetime import datetime, timedelta
+from urllib.request import urlopen
+
+import astropy.units as u
+import numpy as np
+from astropy.table import Table
+from astropy_healpix import HEALPix, lonlat_to_healpix, uniq_to_level_ipix
+from gcn_listener.gcn_utils import get_dateobs, get_event_name, get_skymap, \
+    get_tags, is_retraction
+
+logger = logging.getLogger(__name__)
+
+# Timeout (s) for skymap downloads, which run in the consume loop
+SKYMAP_TIMEOUT = 30
+
+
+def read_skymap(path, timeout: float = SKYMAP_TIMEOUT):
+    """
+    Function to read a HEALPix skymap as multi-order (UNIQ) pixels. Both
+    multi-order (UNIQ, PROBDENSITY) and flat (PROB) skymaps are supported.
+
+    :param path: path, URL or file object of the skymap FITS file
+    :param timeout: Timeout in seconds for downloading the skymap
+    :return: (uniq, probdensity) arrays, probdensity in 1/sr
+    """
+    if isinstance(path, str) and path.startswith('http'):
+        # Download into memory, so that nothing is left behind on disk
+        with urlopen(path, timeout=timeout) as response:
+            path = io.BytesIO(response.read())
+    table = Table.read(path, format='fits')
+
+    if 'UNIQ' in table.colnames:
+        uniq = np.asarray(table['UNIQ'], dtype=np.int64)
+        probdensity = np.asarray(table['PROBDENSITY'], dtype=float)
+        return uniq, probdensity
+
+    prob = np.asarray(table['PROB'], dtype=float).ravel()
+    nside = int(table.meta['NSIDE'])
+    order = int(np.log2(nside))
+    ipix = np.arange(len(prob), dtype=np.int64)
+    if table.meta.get('ORDERING', 'RING').upper() == 'RING':
+        ipix = HEALPix(nside=nside, order='ring').ring_to_nested(ipix)
+    uniq = 4 * 4 ** order + ipix
+    probdensity = prob / (4 * np.pi / len(prob))
+    return uniq, probdensity
+
+
+class GWEventRegion:
+    """
+    Credible levels of a GW skymap, stored as the sorted start indices of its
+    pixels at the skymap's finest order so that a position is looked up with a
+    single binary search.
+    """
+
+    def __init__(self, name: str, uniq: np.ndarray, probdensity: np.ndarray,
+                 dateobs: datetime = None):
+        self.name = name
+        self.dateobs = dateobs
+
+        level, ipix = uniq_to_level_ipix(uniq)
+        level = np.asarray(level, dtype=np.int64)
+        ipix = np.asarray(ipix, dtype=np.int64)
+        prob = probdensity * 4 * np.pi / (12 * 4 ** level)
+
+        # Credible level of a pixel is the probability enclosed by all pixels
+        # at least as dense as it
+        order = np.argsort(probdensity)[::-1]
+        credible_level = np.empty(len(prob))
+        credible_level[order] = np.cumsum(prob[order]) / np.sum(prob)
+
+        self.max_level = int(np.max(level))
+        starts = ipix << (2 * (self.max_level - level))
+        sort = np.argsort(starts)
+        self.starts = starts[sort]
+        self.credible_level = credible_level[sort]
+
+    def get_credible_level(self, ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+        """
+        Function to get the credible level at positions in the skymap
+
+        :param ra: right ascension in degrees
+        :param dec: declination in degrees
+        :return: credible level (0-1) at each position
+        """
+        ipix = lonlat_to_healpix(np.atleast_1d(ra) * u.deg,
+                                 np.atleast_1d(dec) * u.deg,
+                                 nside=2 ** self.max_level, order='nested')
+        idx = np.searchsorted(self.starts, ipix, side='right') - 1
+        return self.credible_level[idx]
+
+
+class ActiveEventIndex:
+    """In-memory index of the credible regions of active GW events."""
+
+    def __init__(self, max_age: timedelta = timedelta(days=30)):
+        self.max_age = max_age
+        self.events = {}
+
+    def add_event(self, name: str, skymap, dateobs: datetime = None):
+        uniq, probdensity = read_skymap(skymap)
+        self.events[name] = GWEventRegion(name, uniq, probdensity,
+                                          dateobs=dateobs)
+        logger.info(f"Added {name} to active events "
+                    f"({len(self.events)} active)")
+
+    def remove_event(self, name: str):
+        if self.events.pop(name, None) is not None:
+            logger.info(f"Removed {name} from active events")
+
+    def update(self, root, reject_tags: list = None):
+        """
+        Function to update the index from a LIGO/Virgo notice (VOEvent or
+        JSON alert): retractions remove the event, notices with a skymap add
+        or replace it.
+
+        :param root: VOEvent root or JSON alert
+        :param reject_tags: Events with any of these tags (e.g. MDC) are not
+        added
+        :return: None
+        """
+        name = get_event_name(root)
+        if name is None:
+            return
+        if is_retraction(root):
+            self.remove_event(name)
+            return
+        if reject_tags is not None:
+            tags_intersection = set(get_tags(root)).intersection(reject_tags)
+            if len(tags_intersection) > 0:
+                logger.info(f"Not adding {name} to active events due to "
+                            f"{list(tags_intersection)} tags")
+                return
+        skymap = get_skymap(root)
+        if skymap is not None:
+            self.add_event(name, skymap, dateobs=get_dateobs(root))
+        self.expire()
+
+    def expire(self, now: datetime = None):
+        """Remove events older than max_age."""
+        if now is None:
+            now = datetime.utcnow()
+        for name, event in list(self.events.items()):
+            if (event.dateobs is not None) and \
+                    (now - event.dateobs > self.max_age):
+                self.remove_event(name)
+
+    def match(self, ra, dec, credible_level: float = 0.9) -> list:
+        """
+        Function to match positions against all active events
+
+        :param ra: right ascension(s) in degrees
+        :param dec: declination(s) in degrees
+        :param credible_level: only return matches within this credible level
+        :return: list of (event name, credible levels) for events containing
+        any of the positions, credible levels has one entry per position
+        """
+        matches = []
+        for name, event in self.events.items():
+            levels = event.get_credible_level(ra, dec)
+            if np.any(levels <= credible_level):
+                matches.append((name, levels))
+        return matches
+
+    def annotate(self, ra: float, dec: float,
+                 credible_level: float = 0.9) -> list:
+        """
+        Function to describe the active events containing a position
+
+        :param ra: right ascension in degrees
+        :param dec: declination in degrees
+        :param credible_level: only describe matches within this credible level
+        :return: list of annotation strings
+        """
+        return [f"Within {np.ceil(levels[0] * 100):.0f}% credible region "
+                f"of {name}"
+                for name, levels in self.match(ra, dec,
+                                               credible_level=credible_level)]
@@ -1,11 +1,13 @@
 # Module to download emails and check if they are Einstein Probe
 
+import argparse
 import email
 import imaplib
 import numpy as np
 import os
 from time import sleep
 from gcn_listener.actions import make_phone_call, send_message
+from gcn_listener.profiling import MessageProfiler, default_profile_dir
 from pathlib import Path
 
 email_user = os.getenv("EMAIL_USER")
@@ -14,29 +16,38 @@ recipients = os.getenv("RECIPIENT_PHONE").split(",")
 
 email_log_path = Path(__file__).parent / "data/email_ids.txt"
 
-def listen_email(listen_from_email: str = "no-reply@gcn.nasa.gov"):
+def listen_email(listen_from_email: str = "no-reply@gcn.nasa.gov",
+                 profiler: MessageProfiler = None):
     """
     Function to download emails from Einstein Probe email account
+    :param listen_from_email: Sender to search the inbox for
+    :param profiler: MessageProfiler to time each email with
     :return: None
     """
+    if profiler is None:
+        profiler = MessageProfiler(enabled=False)
+
     # Login to email account
     mail = imaplib.IMAP4_SSL("imap.gmail.com")
     mail.login(email_user, email_pass)
     mail.select("inbox")
 
-    # Search for emails from ep_ta@bao.ac.cn
-    result, data = mail.search(None,
-                               f'(FROM "{listen_from_email}")')
-    ids = data[0]
-    id_list = ids.split()
-    id_nums = [int(i) for i in id_list]
-    # Load ids from file
-    with open(email_log_path, "r") as f:
-        email_ids = f.read().splitlines()
-    email_ids = [int(i) for i in email_ids]
+    with profiler.message("email-poll") as record:
+        # Search for emails from ep_ta@bao.ac.cn
+        with record.stage('search'):
+            result, data = mail.search(None,
+                                       f'(FROM "{listen_from_email}")')
+        ids = data[0]
+        id_list = ids.split()
+        id_nums = [int(i) for i in id_list]
+        # Load ids from file
+        with record.stage('load_ids'):
+            with open(email_log_path, "r") as f:
+                email_ids = f.read().splitlines()
+            email_ids = [int(i) for i in email_ids]
 
-    # Check if email has been looked at
-    new_ids = np.setdiff1d(id_nums, email_ids)
+        # Check if email has been looked at
+        new_ids = np.setdiff1d(id_nums, email_ids)
 
     if len(new_ids) == 0:
         print("No new emails from GCN")
@@ -44,30 +55,34 @@ def listen_email(listen_from_email: str = "no-reply@gcn.nasa.gov"):
 
     # Get the emails that haven't been looked at yet
     for i in new_ids:
-        result, data = mail.fetch(str(i), "(RFC822)")
-        raw_email = data[0][1]
-        raw_email_string = raw_email.decode("utf-8")
-        email_message = email.message_from_string(raw_email_string)
-        for part in email_message.walk():
-            if part.get_content_type() == "text/plain":
-                body = part.get_payload(decode=True)
-                # print(body.decode("utf-8"))
-
-                body_str = body.decode("utf-8")
-                body_str_lines = np.array(body_str.split("\n"))
-
-                from_line = ["FROM" in x for x in body_str_lines]
-
-                if len(body_str_lines[from_line]) == 0:
-                    continue
-                from_text = body_str_lines[from_line][0]
-                print(from_text)
-                if "ep_ta@bao.ac.cn" in from_text:
-                    print(f"Found Einstein Probe email with id {i}")
-                    make_phone_call(call_recipients=recipients,
-                                    message_text="New Einstein Probe alert")
-                    send_message(message_recipients=recipients,
-                                 message_text="New Einstein Probe alert")
+        with profiler.message(f"email:{i}") as record:
+            with record.stage('fetch'):
+                result, data = mail.fetch(str(i), "(RFC822)")
+            raw_email = data[0][1]
+            raw_email_string = raw_email.decode("utf-8")
+            email_message = email.message_from_string(raw_email_string)
+            for part in email_message.walk():
+                if part.get_content_type() == "text/plain":
+                    with record.stage('parse'):
+                        body = part.get_payload(decode=True)
+                        # print(body.decode("utf-8"))
+
+                        body_str = body.decode("utf-8")
+                        body_str_lines = np.array(body_str.split("\n"))
+
+                        from_line = ["FROM" in x for x in body_str_lines]
+
+                    if len(body_str_lines[from_line]) == 0:
+                        continue
+                    from_text = body_str_lines[from_line][0]
+                    print(from_text)
+                    if "ep_ta@bao.ac.cn" in from_text:
+                        print(f"Found Einstein Probe email with id {i}")
+                        with record.stage('notify'):
+                            make_phone_call(call_recipients=recipients,
+                                            message_text="New Einstein Probe alert")
+                            send_message(message_recipients=recipients,
+                                         message_text="New Einstein Probe alert")
 
     # Save ids to file
     with open(email_log_path, "a") as f:
@@ -76,6 +91,20 @@ def listen_email(listen_from_email: str = "no-reply@gcn.nasa.gov"):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-profile', '--profile', action='store_true',
+                        help='Profile email processing (CPU and allocations)')
+    parser.add_argument('-profile_dir', default=default_profile_dir,
+                        help='Directory to write profiles to')
+    parser.add_argument('-profile_interval', default=3600., type=float,
+                        help='Seconds between profile dumps')
+    args = parser.parse_args()
+
+    profiler = MessageProfiler(enabled=args.profile,
+                               outdir=args.profile_dir,
+                               dump_interval=args.profile_interval)
+    profiler.start()
     while True:
-        listen_email()
+        listen_email(profiler=profiler)
+        profiler.poll()
         sleep(30)
@@ -0,0 +1,491 @@
+# Module to track whether alert calls are acknowledged and escalate through an
+# on-call list when they are not. Twilio reports call status and key presses
+# to a small HTTP server run by the listener.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import urlopen
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+from twilio.request_validator import RequestValidator
+from gcn_listener.actions import get_twilio_client
+
+logger = logging.getLogger(__name__)
+
+default_store_path = Path("~/Data/gcn_listener/escalation.db").expanduser()
+
+# Call statuses after which the call is over
+final_call_statuses = ['completed', 'busy', 'no-answer', 'failed', 'canceled']
+
+
+def make_ack_twiml(message_text: str, ack_url: str, repeat: int = 3) -> str:
+    """
+    Function to make TwiML that reads the message and asks the callee to press
+    1 to acknowledge it
+
+    :param message_text: Text to read
+    :param ack_url: URL Twilio posts the pressed digits to
+    :param repeat: Number of times to read the message
+    :return: TwiML string
+    """
+    say = f"<Say>{escape(message_text)}. Press 1 to acknowledge.</Say>"
+    return f'<Response>' \
+           f'<Gather numDigits="1" action={quoteattr(ack_url)} method="POST">' \
+           f'{say * repeat}' \
+           f'</Gather>' \
+           f'<Say>Alert not acknowledged.</Say>' \
+           f'</Response>'
+
+
+class EscalationStore:
+    """SQLite store of alerts and the calls made for them, so that escalation
+    continues across listener restarts."""
+
+    def __init__(self, path: str | Path = default_store_path):
+        path = Path(path)
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                "alert_id TEXT PRIMARY KEY, message_text TEXT, "
+                "created REAL, level INTEGER, last_call REAL, "
+                "acked REAL, acked_by TEXT, exhausted INTEGER DEFAULT 0)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS calls ("
+                "call_sid TEXT PRIMARY KEY, alert_id TEXT, level INTEGER, "
+                "recipient TEXT, status TEXT, updated REAL)")
+
+    def add_alert(self, alert_id: str, message_text: str):
+        with self._lock, self.conn:
+            now = time.time()
+            self.conn.execute(
+                "INSERT INTO alerts (alert_id, message_text, created, level, "
+                "last_call) VALUES (?, ?, ?, 0, ?)",
+                (alert_id, message_text, now, now))
+
+    def get_alert(self, alert_id: str) -> dict:
+        with self._lock:
+            cursor = self.conn.execute(
+                "SELECT * FROM alerts WHERE alert_id = ?", (alert_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def get_pending_alerts(self) -> list:
+        """Get alerts that are neither acknowledged nor exhausted."""
+        with self._lock:
+            cursor = self.conn.execute(
+                "SELECT * FROM alerts WHERE acked IS NULL AND exhausted = 0")
+            names = [c[0] for c in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def add_call(self, call_sid: str, alert_id: str, level: int,
+                 recipient: str):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO calls VALUES (?, ?, ?, ?, 'queued', ?)",
+                (call_sid, alert_id, level, recipient, now))
+            self.conn.execute(
+                "UPDATE alerts SET level = ?, last_call = ? WHERE alert_id = ?",
+                (level, now, alert_id))
+
+    def get_call(self, call_sid: str) -> dict:
+        with self._lock:
+            cursor = self.conn.execute(
+                "SELECT * FROM calls WHERE call_sid = ?", (call_sid,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def update_call(self, call_sid: str, status: str):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE calls SET status = ?, updated = ? WHERE call_sid = ?",
+                (status, time.time(), call_sid))
+
+    def acknowledge(self, alert_id: str, acked_by: str) -> bool:
+        """Mark an alert acknowledged. Returns False if it already was."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE alerts SET acked = ?, acked_by = ? "
+                "WHERE alert_id = ? AND acked IS NULL",
+                (time.time(), acked_by, alert_id))
+            return cursor.rowcount > 0
+
+    def set_level(self, alert_id: str, level: int):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE alerts SET level = ?, last_call = ? WHERE alert_id = ?",
+                (level, time.time(), alert_id))
+
+    def set_exhausted(self, alert_id: str):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE alerts SET exhausted = 1 WHERE alert_id = ?",
+                (alert_id,))
+
+    def get_ack_latencies(self) -> list:
+        """Get the time to human acknowledgement (s) of acknowledged alerts."""
+        with self._lock:
+            cursor = self.conn.execute(
+                "SELECT acked - created FROM alerts WHERE acked IS NOT NULL")
+            return [row[0] for row in cursor.fetchall()]
+
+
+class CallbackHandler(BaseHTTPRequestHandler):
+    """Handle Twilio status callbacks (/status) and key presses (/ack)."""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        params = {k: v[0] for k, v in parse_qs(body).items()}
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        validator = self.server.validator
+        if validator is not None:
+            signature = self.headers.get('X-Twilio-Signature', '')
+            public_url = self.server.public_url.rstrip('/') + self.path
+            if not validator.validate(public_url, params, signature):
+                logger.warning(f"Rejected callback with invalid signature "
+                               f"to {self.path}")
+                self.send_response(403)
+                self.end_headers()
+                return
+
+        manager = self.server.manager
+        twiml = '<Response/>'
+        if url.path == '/status':
+            manager.on_call_status(params.get('CallSid'),
+                                   params.get('CallStatus'))
+        elif url.path == '/ack':
+            if manager.on_digits(query.get('alert_id'), params.get('CallSid'),
+                                 params.get('Digits')):
+                twiml = '<Response><Say>Alert acknowledged. ' \
+                        'Thank you.</Say></Response>'
+            else:
+                twiml = '<Response><Say>Alert not acknowledged.</Say></Response>'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        data = twiml.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class EscalationManager:
+    """
+    Call the first number of an on-call list for each alert and move down the
+    list until someone presses 1. A number is skipped when its call cannot be
+    placed, ends without an acknowledgement, or after ack_timeout seconds.
+    Alerts older than max_alert_age seconds are given up on rather than
+    escalated, so that a restart does not phone people about stale alerts.
+    """
+
+    def __init__(self,
+                 on_call: list,
+                 public_url: str = None,
+                 ack_timeout: float = 300.,
+                 max_alert_age: float = 3600.,
+                 store: EscalationStore = None,
+                 calls=None,
+                 twilio_phone_number: str = os.getenv("TWILIO_PHONE", None),
+                 validator=None,
+                 port: int = 8080,
+                 check_interval: float = 10.):
+        """
+        :param on_call: Phone numbers to call, in order
+        :param public_url: URL at which Twilio can reach the callback server,
+        defaults to http://localhost:<port>
+        :param ack_timeout: Seconds to wait for an acknowledgement per number
+        :param max_alert_age: Seconds after which an alert is not escalated
+        :param store: EscalationStore to keep state in
+        :param calls: Object with a Twilio-like create(), defaults to the
+        calls of a twilio Client
+        :param twilio_phone_number: Twilio phone number
+        :param validator: twilio RequestValidator to check callback signatures
+        :param port: Port to run the callback server on
+        :param check_interval: Seconds between checks for timed out alerts
+        """
+        # pylint: disable=too-many-arguments
+        if store is None:
+            store = EscalationStore()
+        if calls is None:
+            auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+            calls = get_twilio_client(os.getenv("TWILIO_ACCOUNT_SID"),
+                                      auth_token).calls
+            if validator is None:
+                validator = RequestValidator(auth_token)
+        self.on_call = on_call
+        self.ack_timeout = ack_timeout
+        self.max_alert_age = max_alert_age
+        self.store = store
+        self.calls = calls
+        self.twilio_phone_number = twilio_phone_number
+        self.check_interval = check_interval
+        self.server = ThreadingHTTPServer(('', port), CallbackHandler)
+        if public_url is None:
+            public_url = f"http://localhost:{self.port}"
+        self.public_url = public_url.rstrip('/')
+        self.server.manager = self
+        self.server.validator = validator
+        self.server.public_url = self.public_url
+        self._escalate_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        """Start the callback server and the timeout checks."""
+        if len(self._threads) > 0:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever,
+                             name='escalation-server', daemon=True),
+            threading.Thread(target=self._check_loop,
+                             name='escalation-checks', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Escalation callback server listening on port {self.port}"
+                    f" for {self.public_url}")
+
+    def stop(self):
+        self._stop.set()
+        self.server.shutdown()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def alert(self, message_text: str) -> str:
+        """
+        Function to start an escalating alert
+
+        :param message_text: Text to read out on the call
+        :return: alert id
+        """
+        alert_id = uuid.uuid4().hex
+        self.store.add_alert(alert_id, message_text)
+        if not self.try_call(alert_id, 0):
+            if not self.escalate(alert_id, 0, reason="could not be called"):
+                raise RuntimeError(f"Could not call anyone on the on-call "
+                                   f"list for alert {alert_id}")
+        return alert_id
+
+    def call(self, alert_id: str, level: int):
+        alert = self.store.get_alert(alert_id)
+        recipient = self.on_call[level]
+        ack_url = f"{self.public_url}/ack?{urlencode({'alert_id': alert_id})}"
+        logger.info(f"Calling {recipient} for alert {alert_id} "
+                    f"(on-call level {level})")
+        call = self.calls.create(
+            twiml=make_ack_twiml(alert['message_text'], ack_url),
+            from_=self.twilio_phone_number,
+            to=recipient,
+            status_callback=f"{self.public_url}/status",
+            status_callback_event=['initiated', 'ringing', 'answered',
+                                   'completed'],
+        )
+        self.store.add_call(call.sid, alert_id, level, recipient)
+
+    def try_call(self, alert_id: str, level: int) -> bool:
+        """Call a level of the on-call list, returns False if the call could
+        not be placed."""
+        try:
+            self.call(alert_id, level)
+        except Exception as e:
+            logger.error(f"Failed to call {self.on_call[level]} "
+                         f"with error {e}")
+            return False
+        return True
+
+    def next_level(self, alert_id: str, from_level: int,
+                   reason: str = "did not acknowledge") -> int:
+        """
+        Function to move an alert to the next level of the on-call list
+
+        :param alert_id: alert id
+        :param from_level: Level the alert is expected to be at
+        :param reason: Why the alert is being escalated, for the log
+        :return: new level, or None if the alert was acknowledged, already
+        escalated past from_level, too old, or has no levels left
+        """
+        with self._escalate_lock:
+            alert = self.store.get_alert(alert_id)
+            if (alert is None) or (alert['acked'] is not None) or \
+                    alert['exhausted'] or (alert['level'] != from_level):
+                return None
+            if time.time() - alert['created'] > self.max_alert_age:
+                logger.warning(f"Alert {alert_id} is older than "
+                               f"{self.max_alert_age:g} s, not escalating")
+                self.store.set_exhausted(alert_id)
+                return None
+            level = from_level + 1
+            if level >= len(self.on_call):
+                logger.error(f"Alert {alert_id} was not acknowledged by anyone "
+                             f"on the on-call list")
+                self.store.set_exhausted(alert_id)
+                return None
+            logger.warning(f"{self.on_call[from_level]} {reason} for alert "
+                           f"{alert_id}, escalating")
+            self.store.set_level(alert_id, level)
+            return level
+
+    def escalate(self, alert_id: str, from_level: int,
+                 reason: str = "did not acknowledge") -> bool:
+        """
+        Function to call the next number on the list. Numbers that cannot be
+        called are skipped straight away. The call is made outside the lock,
+        so a slow Twilio request does not hold up the callbacks.
+
+        :param alert_id: alert id
+        :param from_level: Level the alert is expected to be at
+        :param reason: Why the alert is being escalated, for the log
+        :return: True if a call was placed
+        """
+        level = self.next_level(alert_id, from_level, reason=reason)
+        while level is not None:
+            if self.try_call(alert_id, level):
+                return True
+            level = self.next_level(alert_id, level,
+                                    reason="could not be called")
+        return False
+
+    def on_call_status(self, call_sid: str, status: str):
+        call = self.store.get_call(call_sid)
+        if call is None:
+            logger.warning(f"Status callback for unknown call {call_sid}")
+            return
+        self.store.update_call(call_sid, status)
+        logger.info(f"Call to {call['recipient']} for alert "
+                    f"{call['alert_id']} is {status}")
+        if status in final_call_statuses:
+            self.escalate(call['alert_id'], call['level'],
+                          reason=f"did not acknowledge (call {status})")
+
+    def on_digits(self, alert_id: str, call_sid: str, digits: str) -> bool:
+        """Handle a key press, returns True if the alert exists and is
+        acknowledged, by this press or an earlier one."""
+        if digits != '1':
+            return False
+        call = self.store.get_call(call_sid)
+        acked_by = call['recipient'] if call is not None else None
+        if self.store.acknowledge(alert_id, acked_by):
+            alert = self.store.get_alert(alert_id)
+            logger.info(f"Alert {alert_id} acknowledged by {acked_by}, "
+                        f"time to acknowledgement "
+                        f"{alert['acked'] - alert['created']:.1f} s")
+            logger.info(self.ack_summary())
+            return True
+        alert = self.store.get_alert(alert_id)
+        if alert is None:
+            logger.warning(f"Key press for unknown alert {alert_id}")
+            return False
+        return alert['acked'] is not None
+
+    def ack_summary(self) -> str:
+        """Summary of the time to acknowledgement of all alerts."""
+        latencies = self.store.get_ack_latencies()
+        if len(latencies) == 0:
+            return "No alerts acknowledged yet"
+        return f"Time to acknowledgement over {len(latencies)} alerts: " \
+               f"median {np.median(latencies):.1f} s, " \
+               f"max {np.max(latencies):.1f} s"
+
+    def check_timeouts(self):
+        now = time.time()
+        for alert in self.store.get_pending_alerts():
+            last_call = alert['last_call'] or alert['created']
+            if now - last_call > self.ack_timeout:
+                self.escalate(alert['alert_id'], alert['level'],
+                              reason=f"did not acknowledge within "
+                                     f"{self.ack_timeout:g} s")
+
+    def _check_loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.check_timeouts()
+            except Exception as e:
+                logger.error(f"Escalation check failed with error {e}")
+
+
+class LocalTwilioCalls:
+    """
+    Stand-in for the calls of a twilio Client, for testing escalation without
+    Twilio. Calls are recorded, and answer() / finish() post the callbacks
+    Twilio would send to the callback server. Calls to numbers in unreachable
+    raise, like a failing Twilio API request.
+    """
+
+    class Call:
+        def __init__(self, sid, to, twiml, status_callback):
+            self.sid = sid
+            self.to = to
+            self.twiml = twiml
+            self.status_callback = status_callback
+
+    def __init__(self, unreachable: list = None):
+        if unreachable is None:
+            unreachable = []
+        self.unreachable = unreachable
+        self.created = []
+
+    def create(self, twiml: str, from_: str, to: str,
+               status_callback: str = None, **kwargs):
+        if to in self.unreachable:
+            raise ConnectionError(f"Could not reach Twilio to call {to}")
+        call = self.Call(f"CA{uuid.uuid4().hex}", to, twiml, status_callback)
+        self.created.append(call)
+        return call
+
+    @staticmethod
+    def _post(url: str, params: dict) -> str:
+        with urlopen(url, data=urlencode(params).encode('utf-8')) as response:
+            return response.read().decode('utf-8')
+
+    def answer(self, call, digits: str = '1') -> str:
+        """Answer a call and press digits, returns the TwiML response."""
+        self._post(call.status_callback, {'CallSid': call.sid,
+                                          'CallStatus': 'in-progress'})
+        return self.press(call, digits)
+
+    def press(self, call, digits: str = '1', alert_id: str = None) -> str:
+        """Press digits on a call, optionally for another alert id, returns
+        the TwiML response."""
+        action = ElementTree.fromstring(call.twiml).find('Gather').get('action')
+        if alert_id is not None:
+            action = action.split('?')[0] + '?' + urlencode({'alert_id': alert_id})
+        return self._post(action, {'CallSid': call.sid, 'Digits': digits})
+
+    def finish(self, call, status: str = 'completed'):
+        """End a call with a final status."""
+        self._post(call.status_callback, {'CallSid': call.sid,
+                                          'CallStatus': status})
+
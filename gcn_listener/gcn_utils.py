@@ -8,6 +8,7 @@ import os
 import lxml
 import xmlschema
 from urllib.parse import urlparse
+from gcn_listener import json_utils
 
 
 notice_types_dict = {150: 'LVC_PRELIMINARY',
@@ -41,9 +42,17 @@ def get_root_from_payload(payload):
 
 
 def get_notice_type(root):
+    if isinstance(root, dict):
+        return json_utils.get_notice_type(root)
     return gcn.get_notice_type(root)
 
 
+def get_ivorn(root):
+    if isinstance(root, dict):
+        return json_utils.get_ivorn(root)
+    return root.attrib.get('ivorn', None)
+
+
 def get_trigger(root):
     """Get the trigger ID from a GCN notice."""
 
@@ -59,9 +68,59 @@ def get_trigger(root):
     return value
 
 
+def get_event_name(root):
+    """Get the GW event name (e.g. S230518h) from a LIGO/Virgo notice."""
+    if isinstance(root, dict):
+        return json_utils.get_event_name(root)
+    elem = root.find("./What/Param[@name='GraceID']")
+    if elem is None:
+        return None
+    return elem.attrib.get('value', None)
+
+
+def get_skymap_url(root):
+    """Get the URL of the skymap FITS file from a LIGO/Virgo notice."""
+    elem = root.find(".//Param[@name='skymap_fits']")
+    if elem is None:
+        return None
+    return elem.attrib.get('value', None)
+
+
+def get_position(root):
+    """Get the (ra, dec, error radius) in degrees from a GCN notice, or None
+    if the notice has no position."""
+    if isinstance(root, dict):
+        return None
+    pos2d = root.find(
+        "./WhereWhen/{*}ObsDataLocation"
+        "/{*}ObservationLocation"
+        "/{*}AstroCoords"
+        "/{*}Position2D"
+    )
+    if pos2d is None:
+        return None
+    ra = pos2d.find('./{*}Value2/{*}C1')
+    dec = pos2d.find('./{*}Value2/{*}C2')
+    if (ra is None) | (dec is None):
+        return None
+    error = pos2d.find('./{*}Error2Radius')
+    error = float(error.text) if error is not None else 0.
+    return float(ra.text), float(dec.text), error
+
+
+def get_skymap(root):
+    """Get the skymap of a LIGO/Virgo notice, as a URL for VOEvents or a file
+    object for JSON alerts with the skymap inline."""
+    if isinstance(root, dict):
+        return json_utils.get_skymap(root)
+    return get_skymap_url(root)
+
+
 def get_dateobs(root):
     """Get the UTC event time from a GCN notice, rounded to the nearest second,
     as a datetime.datetime object."""
+    if isinstance(root, dict):
+        return json_utils.get_dateobs(root)
     dateobs = Time(
         root.find(
             "./WhereWhen/{*}ObsDataLocation"
@@ -80,6 +139,8 @@ def get_dateobs(root):
 
 
 def is_retraction(root):
+    if isinstance(root, dict):
+        return json_utils.is_retraction(root)
     retraction = root.find("./What/Param[@name='Retraction']")
     if retraction is not None:
         retraction = int(retraction.attrib['value'])
@@ -89,6 +150,8 @@ def is_retraction(root):
 
 
 def get_properties(root):
+    if isinstance(root, dict):
+        return json_utils.get_properties(root)
 
     property_names = [
         # Gravitational waves
@@ -135,6 +198,10 @@ def get_properties(root):
 
 def get_tags(root):
     """Get source classification tag strings from GCN notice."""
+    if isinstance(root, dict):
+        yield from json_utils.get_tags(root)
+        return
+
     # Get event stream.
     mission = urlparse(root.attrib['ivorn']).path.lstrip('/')
     yield mission
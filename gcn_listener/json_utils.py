@@ -0,0 +1,134 @@
+# Functions to read IGWN JSON alerts (gcn.notices.igwn.gwalert), mirroring the
+# VOEvent functions in gcn_utils. See
+# https://emfollow.docs.ligo.org/userguide/content.html#kafka-notice-gcn-scimma
+
+import base64
+import io
+
+import orjson
+from astropy.time import Time
+
+
+igwn_alert_types_dict = {'EARLY_WARNING': 163,
+                         'PRELIMINARY': 150,
+                         'INITIAL': 151,
+                         'UPDATE': 152,
+                         'RETRACTION': 164,
+                         }
+
+igwn_topics = ['gcn.notices.igwn.gwalert']
+
+# Base64 characters decoded at a time, must be a multiple of 4
+SKYMAP_CHUNK_SIZE = 4 * 65536
+
+
+def get_alert_from_payload(payload):
+    """Parse an IGWN JSON alert. The inline skymap is left base64 encoded
+    until it is needed."""
+    alert = orjson.loads(payload)
+    if not isinstance(alert, dict) or 'superevent_id' not in alert:
+        raise ValueError("payload is not a valid IGWN alert")
+    return alert
+
+
+def get_notice_type(alert):
+    return igwn_alert_types_dict[alert['alert_type']]
+
+
+def get_event_name(alert):
+    return alert['superevent_id']
+
+
+def get_ivorn(alert):
+    return f"ivo://gwnet/LVC#{alert['superevent_id']}-{alert['alert_type']}"
+
+
+def get_dateobs(alert):
+    """Get the UTC event time from an IGWN alert, rounded to the nearest
+    second, as a datetime.datetime object. Retractions have no event, so
+    the alert creation time is used."""
+    event = alert.get('event', None)
+    if event is not None:
+        dateobs = Time(event['time'].rstrip('Z'), precision=0)
+    else:
+        dateobs = Time(alert['time_created'].rstrip('Z'), precision=0)
+    dateobs = Time(dateobs.iso)
+    return dateobs.datetime
+
+
+def is_retraction(alert):
+    return alert['alert_type'] == 'RETRACTION'
+
+
+def get_properties(alert):
+    """Get the same properties as gcn_utils.get_properties from an IGWN
+    alert."""
+    event = alert.get('event', None)
+    if event is None:
+        return {}
+
+    property_dict = {}
+    for group in ['properties', 'classification']:
+        values = event.get(group, None)
+        if values is None:
+            continue
+        for property_name, value in values.items():
+            if value is not None:
+                property_dict[property_name] = float(value)
+    property_dict['FAR'] = float(event['far'])
+
+    # Only keep the properties the VOEvent notices use
+    property_names = ["HasNS", "HasRemnant", "FAR", "BNS", "NSBH", "BBH",
+                      "MassGap", "Terrestrial"]
+    return {k: property_dict[k] for k in property_names if k in property_dict}
+
+
+def get_tags(alert):
+    """Get the same tags as gcn_utils.get_tags from an IGWN alert."""
+    yield 'LVC'
+
+    notice_type = get_notice_type(alert)
+    if notice_type in {150, 151, 152, 164}:
+        yield 'GW'
+
+    if is_retraction(alert):
+        yield 'retracted'
+
+    event = alert.get('event', None)
+    if event is None:
+        return
+
+    classification = event.get('classification', None)
+    if classification:
+        _, name = max([(value, name) for name, value in classification.items()])
+        yield name
+
+    search = event.get('search', None)
+    if search is not None:
+        yield search
+
+    yield from event.get('instruments', [])
+
+
+def get_skymap(alert, chunk_size: int = SKYMAP_CHUNK_SIZE):
+    """
+    Function to decode the inline skymap of an IGWN alert. The base64 string
+    is decoded in chunks into a file object, so the decoded copy is built
+    once without intermediate bytes objects of the full size.
+
+    :param alert: IGWN alert
+    :param chunk_size: number of base64 characters to decode at a time
+    :return: file object with the multi-order skymap FITS, or None
+    """
+    event = alert.get('event', None)
+    if event is None:
+        return None
+    encoded = event.get('skymap', None)
+    if encoded is None:
+        return None
+
+    skymap = io.BytesIO()
+    for i in range(0, len(encoded), chunk_size):
+        skymap.write(base64.b64decode(encoded[i:i + chunk_size]))
+    skymap.seek(0)
+    return skymap
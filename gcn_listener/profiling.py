@@ -0,0 +1,183 @@
+# Module to profile the listeners: per-message CPU profiles, allocation
+# snapshots and a running report of the slowest messages
+
+import cProfile
+import heapq
+import logging
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+default_profile_dir = Path("~/Data/gcn_listener/profiles/").expanduser()
+
+
+class MessageRecord:
+    """Timings for a single message, broken down by processing stage."""
+
+    def __init__(self, ivorn: str = None):
+        self.ivorn = ivorn
+        self.stages = {}
+        self.total = 0.
+        self.received = datetime.utcnow()
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.) + \
+                                time.perf_counter() - t0
+
+    def __lt__(self, other):
+        return self.total < other.total
+
+    def __str__(self):
+        stages = ", ".join([f"{name}={dt * 1e3:.1f}ms"
+                            for name, dt in self.stages.items()])
+        return f"{self.total * 1e3:.1f}ms {self.ivorn} " \
+               f"({self.received.isoformat()}) [{stages}]"
+
+
+class MessageProfiler:
+    """
+    Profile messages processed by a listener. Every sample_every-th message is
+    run under cProfile and its stats are accumulated; tracemalloc tracks
+    allocations throughout. The accumulated CPU stats, an allocation snapshot
+    and a report of the top_n slowest messages are written to outdir every
+    dump_interval seconds, or on SIGUSR1. SIGUSR2 logs the slowest-messages
+    report without writing anything.
+    """
+
+    def __init__(self,
+                 enabled: bool = True,
+                 outdir: str | Path = default_profile_dir,
+                 sample_every: int = 1,
+                 dump_interval: float = 3600.,
+                 top_n: int = 10,
+                 tracemalloc_frames: int = 10):
+        if sample_every < 1:
+            raise ValueError(f"sample_every must be at least 1, "
+                             f"got {sample_every}")
+        self.enabled = enabled
+        self.outdir = Path(outdir)
+        self.sample_every = sample_every
+        self.dump_interval = dump_interval
+        self.top_n = top_n
+        self.tracemalloc_frames = tracemalloc_frames
+        self.n_messages = 0
+        self.slowest = []
+        self.stats = None
+        self.last_snapshot = None
+        self.last_dump = time.monotonic()
+        self._dump_requested = False
+        self._report_requested = False
+
+    def start(self):
+        if not self.enabled:
+            return
+        if not self.outdir.exists():
+            self.outdir.mkdir(parents=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+        signal.signal(signal.SIGUSR1, self._request_dump)
+        signal.signal(signal.SIGUSR2, self._request_report)
+        logger.info(f"Profiling enabled, writing profiles to {self.outdir} "
+                    f"(kill -USR1 {os.getpid()} to dump now)")
+
+    def _request_dump(self, signum, frame):
+        self._dump_requested = True
+
+    def _request_report(self, signum, frame):
+        self._report_requested = True
+
+    @contextmanager
+    def message(self, ivorn: str = None):
+        """
+        Context manager wrapping the processing of one message. The yielded
+        MessageRecord is used to time stages, and its ivorn can be set once
+        the payload has been parsed.
+        """
+        record = MessageRecord(ivorn)
+        if not self.enabled:
+            yield record
+            return
+
+        self.n_messages += 1
+        profile = None
+        if self.n_messages % self.sample_every == 0:
+            profile = cProfile.Profile()
+            profile.enable()
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.total = time.perf_counter() - t0
+            if profile is not None:
+                profile.disable()
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+            if len(self.slowest) < self.top_n:
+                heapq.heappush(self.slowest, record)
+            else:
+                heapq.heappushpop(self.slowest, record)
+            logger.debug(f"Processed message {record}")
+            self.poll()
+
+    def poll(self):
+        """Write or log reports that are due or were requested by a signal."""
+        if not self.enabled:
+            return
+        if self._report_requested:
+            self._report_requested = False
+            logger.info(self.report())
+        if self._dump_requested | \
+                (time.monotonic() - self.last_dump > self.dump_interval):
+            self._dump_requested = False
+            self.dump()
+
+    def report(self) -> str:
+        lines = [f"Top {len(self.slowest)} slowest of "
+                 f"{self.n_messages} messages:"]
+        for record in sorted(self.slowest, reverse=True):
+            lines.append(f"  {record}")
+        return "\n".join(lines)
+
+    def dump(self):
+        """Write CPU stats, an allocation snapshot and the slowest-messages
+        report to outdir."""
+        self.last_dump = time.monotonic()
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+
+        if self.stats is not None:
+            cpu_path = self.outdir / f"cpu_{timestamp}.prof"
+            self.stats.dump_stats(cpu_path)
+            logger.info(f"Written CPU profile to {cpu_path}")
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            mem_path = self.outdir / f"mem_{timestamp}.tracemalloc"
+            snapshot.dump(str(mem_path))
+            current, peak = tracemalloc.get_traced_memory()
+            logger.info(f"Written allocation snapshot to {mem_path} "
+                        f"(traced {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB)")
+            if self.last_snapshot is not None:
+                growth = snapshot.compare_to(self.last_snapshot, 'lineno')
+                lines = ["Largest allocation growth since last dump:"]
+                lines += [f"  {stat}" for stat in growth[:self.top_n]]
+                logger.info("\n".join(lines))
+            self.last_snapshot = snapshot
+
+        report_path = self.outdir / f"slowest_{timestamp}.txt"
+        with open(report_path, 'w') as f:
+            f.write(self.report() + "\n")
+        logger.info(f"Written slowest messages report to {report_path}")
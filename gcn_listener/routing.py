@@ -0,0 +1,233 @@
+# Module to route alerts to notification channels, skipping channels that are
+# known to be down and falling back to other channels when a send fails
+
+import logging
+import socket
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Hosts used to check whether a transport is reachable again
+channel_probe_hosts = {'email': ('smtp.gmail.com', 465),
+                       'sms': ('api.twilio.com', 443),
+                       'call': ('api.twilio.com', 443),
+                       'call_secondary': ('api.twilio.com', 443),
+                       }
+
+# If a channel fails (or is skipped), try these channels in order
+default_fallback_rules = {'email': ['sms'],
+                          'sms': ['email'],
+                          'call': ['call_secondary', 'sms'],
+                          'call_secondary': ['sms'],
+                          }
+
+
+def probe_host(host: str, port: int, timeout: float = 5.) -> bool:
+    """
+    Function to check if a TCP connection can be opened to a host
+
+    :param host: hostname
+    :param port: port
+    :param timeout: timeout in seconds
+    :return: True if the connection succeeded
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class CircuitBreaker:
+    """
+    Track the health of a single channel. After failure_threshold consecutive
+    failures the breaker opens and the channel is skipped until either
+    reset_timeout seconds have passed or a background probe finds the
+    transport reachable again. The circuit is then half-open, and a single
+    trial send decides whether it closes or opens again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name: str,
+                 failure_threshold: int = 2,
+                 reset_timeout: float = 300.):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.n_failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and \
+                    time.monotonic() - self.opened_at > self.reset_timeout:
+                logger.info(f"Channel {self.name} circuit half-open, "
+                            f"allowing a trial send")
+                self.state = self.HALF_OPEN
+            # Only one trial send at a time decides whether the circuit closes
+            if (self.state == self.HALF_OPEN) & (not self.trial_in_progress):
+                self.trial_in_progress = True
+                return True
+            return False
+
+    def half_open(self):
+        """Allow a trial send on an open circuit, e.g. after a probe finds the
+        transport reachable again."""
+        with self._lock:
+            if self.state == self.OPEN:
+                logger.info(f"Channel {self.name} circuit half-open, "
+                            f"allowing a trial send")
+                self.state = self.HALF_OPEN
+                self.trial_in_progress = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Channel {self.name} circuit closed")
+            self.state = self.CLOSED
+            self.n_failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.n_failures += 1
+            self.trial_in_progress = False
+            if (self.state == self.HALF_OPEN) | \
+                    (self.n_failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    logger.warning(f"Channel {self.name} circuit opened after "
+                                   f"{self.n_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ChannelRouter:
+    """
+    Send alerts through channels guarded by circuit breakers, falling back to
+    other channels according to fallback_rules when a channel fails or is
+    known to be down.
+    """
+
+    def __init__(self,
+                 fallback_rules: dict = None,
+                 failure_threshold: int = 2,
+                 reset_timeout: float = 300.,
+                 probe_interval: float = 60.,
+                 probe_hosts: dict = None):
+        if fallback_rules is None:
+            fallback_rules = default_fallback_rules
+        if probe_hosts is None:
+            probe_hosts = channel_probe_hosts
+        self.fallback_rules = fallback_rules
+        self.probe_hosts = probe_hosts
+        self.probe_interval = probe_interval
+        self.breakers = {}
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._probe_thread = None
+        self._stop = threading.Event()
+
+    def get_breaker(self, channel: str) -> CircuitBreaker:
+        if channel not in self.breakers:
+            self.breakers[channel] = CircuitBreaker(
+                channel, failure_threshold=self.failure_threshold,
+                reset_timeout=self.reset_timeout)
+        return self.breakers[channel]
+
+    def try_channel(self, channel: str, send: Callable) -> bool:
+        """
+        Function to send through a single channel if its circuit allows it
+
+        :param channel: channel name
+        :param send: callable that sends the alert
+        :return: True if the alert was sent
+        """
+        breaker = self.get_breaker(channel)
+        if not breaker.allow():
+            logger.warning(f"Skipping channel {channel}, circuit is open")
+            return False
+        try:
+            send()
+        except Exception as e:
+            logger.error(f"Failed to send via {channel} with error {e}")
+            breaker.record_failure()
+            return False
+        breaker.record_success()
+        return True
+
+    def notify(self, channels: list, senders: dict) -> list:
+        """
+        Function to send an alert through the requested channels, walking the
+        fallback rules for any channel that fails
+
+        :param channels: channels requested (e.g. ['email', 'call'])
+        :param senders: dictionary of channel name to callable sending the alert
+        :return: list of channels the alert was delivered through
+        """
+        delivered = []
+        attempted = set()
+        for channel in channels:
+            queue = [channel]
+            while len(queue) > 0:
+                current = queue.pop(0)
+                if (current in attempted) | (current not in senders):
+                    continue
+                attempted.add(current)
+                if self.try_channel(current, senders[current]):
+                    delivered.append(current)
+                    break
+                fallbacks = self.fallback_rules.get(current, [])
+                if len(fallbacks) > 0:
+                    logger.info(f"Falling back from {current} to {fallbacks}")
+                queue.extend(fallbacks)
+        if len(delivered) == 0:
+            logger.error(f"Alert could not be delivered via any of {channels}")
+        return delivered
+
+    def probe(self):
+        """Probe the transports of open circuits, and half-open those that are
+        reachable so that the next send tries them. A TCP connect does not
+        show the API works, so the circuit is only closed by a real send."""
+        for channel, breaker in list(self.breakers.items()):
+            if breaker.state != CircuitBreaker.OPEN:
+                continue
+            if channel not in self.probe_hosts:
+                continue
+            host, port = self.probe_hosts[channel]
+            if probe_host(host, port):
+                logger.info(f"Probe for {channel} ({host}:{port}) succeeded")
+                breaker.half_open()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            try:
+                self.probe()
+            except Exception as e:
+                logger.error(f"Channel probe failed with error {e}")
+
+    def start_probes(self):
+        """Start probing open circuits in a background thread."""
+        if self._probe_thread is not None:
+            return
+        self._stop.clear()
+        self._probe_thread = threading.Thread(target=self._probe_loop,
+                                              name='channel-probes',
+                                              daemon=True)
+        self._probe_thread.start()
+
+    def stop_probes(self):
+        self._stop.set()
+        if self._probe_thread is not None:
+            self._probe_thread.join()
+            self._probe_thread = None
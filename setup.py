@@ -29,10 +29,12 @@ setuptools.setup(
         "lxml",
         "pygcn",
         "astropy",
+        "astropy-healpix",
         "numpy",
         "xmlschema",
         "twilio",
-        "chardet"
+        "chardet",
+        "orjson"
     ],
     package_data={
     }
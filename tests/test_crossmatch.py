@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import SkyCoord
+from astropy_healpix import HEALPix
+from gcn_listener.crossmatch import ActiveEventIndex, GWEventRegion
+from gcn_listener.gcn_utils import get_root_from_payload
+
+examples_dir = Path(__file__).parent.parent / "gcn_listener/data/examples"
+
+
+def make_region(ra=100., dec=20., sigma=3., nside=64):
+    """Gaussian skymap around (ra, dec), as order 6 UNIQ pixels."""
+    healpix = HEALPix(nside=nside, order='nested')
+    lon, lat = healpix.healpix_to_lonlat(np.arange(healpix.npix))
+    sep = SkyCoord(lon, lat).separation(SkyCoord(ra * u.deg, dec * u.deg)).deg
+    prob = np.exp(-0.5 * (sep / sigma) ** 2)
+    prob /= np.sum(prob)
+    uniq = 4 * nside ** 2 + np.arange(healpix.npix)
+    probdensity = prob / (4 * np.pi / healpix.npix)
+    return uniq, probdensity
+
+
+def test_credible_level_peak_and_antipode():
+    region = GWEventRegion('S1', *make_region())
+    levels = region.get_credible_level([100., 280.], [20., -20.])
+    assert levels[0] < 0.05
+    assert levels[1] > 0.99
+
+
+def test_multiorder_matches_flat():
+    uniq, probdensity = make_region()
+    flat = GWEventRegion('S1', uniq, probdensity)
+
+    # Merge the first 10 order 3 pixels (64 order 6 pixels each), far from
+    # the peak, into single coarse pixels
+    coarse_prob = (probdensity * 4 * np.pi / len(uniq)).reshape(-1, 64).sum(1)
+    coarse_uniq = 4 * 8 ** 2 + np.arange(len(coarse_prob))
+    multiorder = GWEventRegion(
+        'S1', np.concatenate([coarse_uniq[:10], uniq[640:]]),
+        np.concatenate([coarse_prob[:10] / (4 * np.pi / 768),
+                        probdensity[640:]]))
+
+    ra = [100., 103., 106., 200.]
+    dec = [20., 20., 20., -40.]
+    np.testing.assert_allclose(multiorder.get_credible_level(ra, dec),
+                               flat.get_credible_level(ra, dec))
+
+
+def test_annotate():
+    index = ActiveEventIndex()
+    index.events['S1'] = GWEventRegion('S1', *make_region())
+    annotations = index.annotate(100., 20.)
+    assert len(annotations) == 1
+    assert annotations[0].endswith('credible region of S1')
+    assert index.annotate(280., -20.) == []
+
+
+def test_update_skips_rejected_tags():
+    with open(examples_dir / "MS181101ab-preliminary.xml", 'rb') as f:
+        root = get_root_from_payload(f.read())
+
+    index = ActiveEventIndex()
+    index.update(root, reject_tags=['MDC'])
+    assert index.events == {}
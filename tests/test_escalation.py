@@ -0,0 +1,91 @@
+import time
+
+import pytest
+from gcn_listener.escalation import EscalationManager, EscalationStore, \
+    LocalTwilioCalls
+
+
+@pytest.fixture
+def calls():
+    return LocalTwilioCalls(unreachable=['+4'])
+
+
+@pytest.fixture
+def manager(tmp_path, calls):
+    manager = EscalationManager(['+1', '+4', '+2', '+3'], ack_timeout=1.,
+                                max_alert_age=60.,
+                                store=EscalationStore(tmp_path / "escalation.db"),
+                                calls=calls, port=0, check_interval=0.1)
+    manager.start()
+    yield manager
+    manager.stop()
+
+
+def called(calls):
+    return [call.to for call in calls.created]
+
+
+def test_missed_call_escalates_skipping_unreachable(manager, calls):
+    manager.alert("Test alert")
+    assert called(calls) == ['+1']
+    calls.finish(calls.created[-1], 'no-answer')
+    assert called(calls) == ['+1', '+2']
+
+
+def test_timeout_escalates(manager, calls):
+    manager.alert("Test alert")
+    calls.finish(calls.created[-1], 'no-answer')
+    time.sleep(1.5)
+    assert called(calls) == ['+1', '+2', '+3']
+
+
+def test_press_1_acknowledges(manager, calls):
+    alert_id = manager.alert("Test alert")
+    response = calls.answer(calls.created[-1], '1')
+    assert 'acknowledged. Thank you' in response
+    calls.finish(calls.created[-1])
+
+    alert = manager.store.get_alert(alert_id)
+    assert alert['acked_by'] == '+1'
+    assert len(manager.store.get_ack_latencies()) == 1
+    assert 'over 1 alerts' in manager.ack_summary()
+
+    # No more calls once acknowledged
+    time.sleep(1.5)
+    assert called(calls) == ['+1']
+
+
+def test_other_keys_and_unknown_alerts_do_not_acknowledge(manager, calls):
+    alert_id = manager.alert("Test alert")
+    assert 'not acknowledged' in calls.press(calls.created[-1], '2')
+    assert 'not acknowledged' in calls.press(calls.created[-1], '1',
+                                             alert_id='unknown')
+    assert manager.store.get_alert(alert_id)['acked'] is None
+
+
+def test_exhausted_on_call_list(manager, calls):
+    alert_id = manager.alert("Test alert")
+    for _ in range(3):
+        calls.finish(calls.created[-1], 'busy')
+    assert called(calls) == ['+1', '+2', '+3']
+    assert manager.store.get_alert(alert_id)['exhausted']
+
+
+def test_unreachable_first_number(manager, calls):
+    calls.unreachable.append('+1')
+    manager.alert("Test alert")
+    assert called(calls) == ['+2']
+
+
+def test_nobody_reachable_raises(manager, calls):
+    calls.unreachable.extend(['+1', '+2', '+3'])
+    with pytest.raises(RuntimeError):
+        manager.alert("Test alert")
+
+
+def test_stale_alert_not_escalated(manager, calls):
+    manager.max_alert_age = 0.5
+    alert_id = manager.alert("Test alert")
+    time.sleep(1.5)
+    assert called(calls) == ['+1']
+    assert manager.store.get_alert(alert_id)['exhausted']
@@ -0,0 +1,63 @@
+import base64
+import io
+from pathlib import Path
+
+import numpy as np
+import orjson
+from astropy.table import Table
+from gcn_listener.gcn_utils import get_dateobs, get_event_name, get_notice_type, \
+    get_properties, get_root_from_payload, get_tags, is_retraction
+from gcn_listener.json_utils import get_alert_from_payload, get_skymap
+
+examples_dir = Path(__file__).parent.parent / "gcn_listener/data/examples"
+
+
+def load_examples():
+    with open(examples_dir / "MS181101ab-preliminary.xml", 'rb') as f:
+        voevent = get_root_from_payload(f.read())
+    with open(examples_dir / "MS181101ab-preliminary.json", 'rb') as f:
+        alert = get_alert_from_payload(f.read())
+    return voevent, alert
+
+
+def test_json_matches_voevent():
+    voevent, alert = load_examples()
+
+    voevent_properties = get_properties(voevent)
+    alert_properties = get_properties(alert)
+    assert alert_properties == voevent_properties
+    assert alert_properties['FAR'] == voevent_properties['FAR']
+    assert alert_properties['HasNS'] == voevent_properties['HasNS']
+
+    voevent_tags = list(get_tags(voevent))
+    alert_tags = list(get_tags(alert))
+    assert alert_tags == voevent_tags
+    assert {'MDC', 'GW'}.issubset(alert_tags)
+
+    assert get_notice_type(alert) == get_notice_type(voevent)
+    assert get_dateobs(alert) == get_dateobs(voevent)
+    assert get_event_name(alert) == get_event_name(voevent)
+    assert not is_retraction(alert)
+
+
+def test_retraction():
+    _, alert = load_examples()
+    alert['alert_type'] = 'RETRACTION'
+    alert['event'] = None
+    assert is_retraction(alert)
+    assert 'retracted' in list(get_tags(alert))
+    assert get_properties(alert) == {}
+
+
+def test_inline_skymap():
+    _, alert = load_examples()
+    table = Table({'UNIQ': 4 * 4 ** 2 + np.arange(192),
+                   'PROBDENSITY': np.ones(192) / (4 * np.pi)})
+    fits_file = io.BytesIO()
+    table.write(fits_file, format='fits')
+    alert['event']['skymap'] = base64.b64encode(
+        fits_file.getvalue()).decode('ascii')
+    alert = get_alert_from_payload(orjson.dumps(alert))
+
+    skymap = Table.read(get_skymap(alert, chunk_size=64), format='fits')
+    np.testing.assert_array_equal(skymap['UNIQ'], table['UNIQ'])
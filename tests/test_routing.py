@@ -0,0 +1,76 @@
+from gcn_listener.routing import ChannelRouter, CircuitBreaker
+
+
+def fail():
+    raise TimeoutError("timed out")
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker('email', failure_threshold=2)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_allows_single_trial():
+    breaker = CircuitBreaker('email', failure_threshold=1)
+    breaker.record_failure()
+    breaker.half_open()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed trial opens the circuit again, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    breaker.half_open()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.n_failures == 0
+
+
+def test_breaker_half_opens_after_reset_timeout():
+    breaker = CircuitBreaker('email', failure_threshold=1, reset_timeout=0.)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_fallback_order():
+    router = ChannelRouter(failure_threshold=1)
+    sent = []
+    senders = {'email': fail,
+               'sms': lambda: sent.append('sms'),
+               'call': fail,
+               'call_secondary': lambda: sent.append('call_secondary')}
+    delivered = router.notify(['email', 'call'], senders)
+    assert delivered == ['sms', 'call_secondary']
+    assert sent == ['sms', 'call_secondary']
+
+
+def test_open_channel_is_skipped():
+    router = ChannelRouter(failure_threshold=1)
+    n_calls = []
+
+    def hang():
+        n_calls.append(1)
+        fail()
+
+    senders = {'email': hang, 'sms': lambda: None}
+    assert router.notify(['email'], senders) == ['sms']
+    assert router.notify(['email'], senders) == ['sms']
+    assert len(n_calls) == 1
+    assert router.breakers['email'].state == CircuitBreaker.OPEN
+
+
+def test_probe_half_opens_reachable_channels(monkeypatch):
+    router = ChannelRouter(failure_threshold=1)
+    router.notify(['email'], {'email': fail})
+    monkeypatch.setattr('gcn_listener.routing.probe_host',
+                        lambda host, port: True)
+    router.probe()
+    assert router.breakers['email'].state == CircuitBreaker.HALF_OPEN